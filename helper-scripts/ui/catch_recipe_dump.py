@@ -1,42 +1,117 @@
 import json
+import mmap
 import re
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 LOG_PATH = "server/logs/latest.log"
 OUTPUT_FILE = "cache/dumped_recipes.json"
 
+# Markers printed by kubejs-scripts/dump_recipes.js, matched as raw bytes so
+# lines outside the dump never need to be decoded.
+START_MARKER = b"AGENTSYS_RECIPE_DUMP_START"
+END_MARKER = b"AGENTSYS_RECIPE_DUMP_END"
+DATA_MARKER = b"AGENTSYS_DATA::"
+DATA_PATTERN = re.compile(rb"AGENTSYS_DATA::(.+)$", re.MULTILINE)
+
+# orjson parses and writes the recipe JSON much faster than the stdlib; both
+# accept bytes and ignore surrounding whitespace.
+if orjson is not None:
+    loads = orjson.loads
+else:
+    loads = json.loads
+
+def save_recipes(recipes):
+    """Write the captured recipes to OUTPUT_FILE as indented JSON."""
+    if orjson is not None:
+        with open(OUTPUT_FILE, "wb") as out:
+            out.write(orjson.dumps(recipes, option=orjson.OPT_INDENT_2))
+    else:
+        with open(OUTPUT_FILE, "w", encoding="utf-8") as out:
+            json.dump(recipes, out, indent=2)
+
+def scan_log_tail():
+    """
+    Find the last complete dump block by searching backwards through a
+    memory-mapped log, so only the dump itself is read. If no block is
+    complete (e.g. the server stopped mid-dump), the last started block is
+    read up to the end of the log.
+    Returns None if the log can't be mapped.
+    """
+    with open(LOG_PATH, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError): # e.g. empty log files can't be mapped
+            return None
+
+        with mm:
+            end = mm.rfind(END_MARKER)
+            start = mm.rfind(START_MARKER, 0, end) if end >= 0 else -1
+            if start >= 0:
+                print("Found dump start and end markers.")
+            else:
+                end = len(mm)
+                start = mm.rfind(START_MARKER)
+                if start < 0:
+                    return []
+                print("Found dump start marker without an end marker.")
+
+            recipes = []
+            for match in DATA_PATTERN.finditer(mm, start, end):
+                try:
+                    recipes.append(loads(match.group(1)))
+                except Exception as e:
+                    print(f"Failed to parse line: {e}")
+            return recipes
+
+def scan_log_forward():
+    """Stream the log from the start, capturing the first dump block."""
+    recipes = []
+
+    with open(LOG_PATH, "rb", buffering=1 << 20) as f:
+        for line in f:
+            if START_MARKER in line:
+                print("Found dump start marker. Capturing...")
+                break
+        else:
+            return recipes
+
+        # Local names avoid global/attribute lookups on every captured line
+        append = recipes.append
+        decode = loads
+        end_marker = END_MARKER
+        data_marker = DATA_MARKER
+        data_offset = len(DATA_MARKER)
+
+        for line in f:
+            if end_marker in line:
+                print("Found dump end marker.")
+                break
+
+            index = line.find(data_marker)
+            if index != -1:
+                try:
+                    append(decode(line[index + data_offset:]))
+                except Exception as e:
+                    print(f"Failed to parse line: {e}")
+
+    return recipes
+
 def extract_recipes_from_log():
     print(f"Reading log file: {LOG_PATH}...")
     
-    recipes = []
-    capturing = False
-    
     try:
-        with open(LOG_PATH, "r", encoding="utf-8", errors="ignore") as f:
-            for line in f:
-                if "AGENTSYS_RECIPE_DUMP_START" in line:
-                    print("Found dump start marker. Capturing...")
-                    recipes = [] # Reset in case of multiple dumps
-                    capturing = True
-                    continue
-                
-                if "AGENTSYS_RECIPE_DUMP_END" in line:
-                    print("Found dump end marker.")
-                    capturing = False
-                    break
-                
-                if capturing and "AGENTSYS_DATA::" in line:
-                    try:
-                        raw_json = line.split("AGENTSYS_DATA::", 1)[1].strip()
-                        recipe_obj = json.loads(raw_json)
-                        recipes.append(recipe_obj)
-                    except Exception as e:
-                        print(f"Failed to parse line: {e}")
+        recipes = scan_log_tail()
+        if recipes is None:
+            recipes = scan_log_forward()
 
         if recipes:
             print(f"Successfully extracted {len(recipes)} recipes.")
 
-            with open(OUTPUT_FILE, "w", encoding="utf-8") as out:
-                json.dump(recipes, out, indent=2)
+            save_recipes(recipes)
             
             print(f"Saved to {OUTPUT_FILE}")
         else:
@@ -1,147 +1,302 @@
 import os
+import gzip
 import json
+import pickle
+import shutil
+import struct
 import zipfile
 import urllib.request
 from pathlib import Path
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Union
+
+try:
+    import msgspec
+
+    class RegistryValues(msgspec.Struct):
+        values: list[str]
+except ImportError:
+    msgspec = None
 
 MCMETA_BASE_URL = "https://raw.githubusercontent.com/misode/mcmeta/registries"
 CACHE_DIR = Path("cache")
+JAR_CACHE_FILE = CACHE_DIR / "jar_ids.pkl"
+VANILLA_PREFIX = "minecraft:"
+
+def decode_registry(raw):
+    """
+    Decode registry JSON into a list of names. MCMeta serves either a bare
+    list or a dict with a "values" list.
+    """
+    if msgspec is not None:
+        # Typed decode builds the list of str directly
+        try:
+            data = msgspec.json.decode(raw, type=Union[list[str], RegistryValues])
+        except msgspec.ValidationError:
+            return None
+        return data if isinstance(data, list) else data.values
+    
+    data = json.loads(raw)
+    if isinstance(data, dict):
+        data = data.get("values")
+    return data if isinstance(data, list) else None
+
+def load_registry_cache(cache_file):
+    """Decode a gzipped registry cache file."""
+    with open(cache_file, 'rb') as f:
+        return decode_registry(gzip.decompress(f.read()))
 
 def download_vanilla_registry(registry_type, version=None):
-    """Download vanilla item or block registry from MCMeta repo."""
+    """Download vanilla item or block registry names from MCMeta repo."""
     CACHE_DIR.mkdir(exist_ok=True)
     
     # Use version-specific URL if provided, otherwise use latest
     if version:
         url = f"https://raw.githubusercontent.com/misode/mcmeta/{version}-registries/{registry_type}/data.min.json"
-        cache_file = CACHE_DIR / f"{registry_type}_{version}.json"
+        cache_file = CACHE_DIR / f"{registry_type}_{version}.json.gz"
     else:
         url = f"{MCMETA_BASE_URL}/{registry_type}/data.min.json"
-        cache_file = CACHE_DIR / f"{registry_type}_latest.json"
+        cache_file = CACHE_DIR / f"{registry_type}_latest.json.gz"
     
     if cache_file.exists():
         print(f"Using cached {registry_type} registry from {cache_file}")
-        with open(cache_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return data
+        return load_registry_cache(cache_file)
+    
+    # Uncompressed caches written by older versions of this script
+    legacy_cache_file = cache_file.with_suffix('')
+    if legacy_cache_file.exists():
+        print(f"Using cached {registry_type} registry from {legacy_cache_file}")
+        with open(legacy_cache_file, 'rb') as f:
+            return decode_registry(f.read())
     
     print(f"Downloading {registry_type} registry from MCMeta...")
+    partial_file = cache_file.with_name(cache_file.name + '.part')
     try:
-        with urllib.request.urlopen(url) as response:
-            data = json.loads(response.read().decode('utf-8'))
-        
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f)
+        request = urllib.request.Request(url, headers={"Accept-Encoding": "gzip"})
+        with urllib.request.urlopen(request) as response:
+            # Stream the body straight to disk; it only needs compressing
+            # here if the server didn't already send it gzipped.
+            if response.headers.get("Content-Encoding") == "gzip":
+                with open(partial_file, 'wb') as f:
+                    shutil.copyfileobj(response, f)
+            else:
+                with gzip.open(partial_file, 'wb') as f:
+                    shutil.copyfileobj(response, f)
+        os.replace(partial_file, cache_file)
         
         print(f"Cached {registry_type} registry to {cache_file}")
-        return data
+        return load_registry_cache(cache_file)
     except Exception as e:
         print(f"Error downloading {registry_type} registry: {e}")
+        partial_file.unlink(missing_ok=True)
         return None
 
 def get_vanilla_ids(version=None):
     """Get vanilla item and block IDs from MCMeta repo."""
     vanilla_ids = set()
     
-    item_data = download_vanilla_registry("item", version)
-    if item_data:
-        items_list = item_data.get("values", item_data) if isinstance(item_data, dict) else item_data
-        if isinstance(items_list, list):
-            vanilla_ids.update(f"minecraft:{item}" for item in items_list)
-            print(f"  Loaded {len(items_list)} vanilla items")
+    # Both downloads are network-bound, so fetch them at the same time
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        items_future = executor.submit(download_vanilla_registry, "item", version)
+        blocks_future = executor.submit(download_vanilla_registry, "block", version)
+        items_list = items_future.result()
+        blocks_list = blocks_future.result()
     
-    block_data = download_vanilla_registry("block", version)
-    if block_data:
-        # Handle both dict with "values" key and direct list
-        blocks_list = block_data.get("values", block_data) if isinstance(block_data, dict) else block_data
-        if isinstance(blocks_list, list):
-            blocks_before = len(vanilla_ids)
+    if items_list:
+        vanilla_ids.update(map(VANILLA_PREFIX.__add__, items_list))
+        print(f"  Loaded {len(items_list)} vanilla items")
+    
+    if blocks_list:
+        blocks_before = len(vanilla_ids)
 
-            vanilla_ids.update(f"minecraft:{block}" for block in blocks_list)
-            new_blocks = len(vanilla_ids) - blocks_before
-            print(f"  Loaded {len(blocks_list)} vanilla blocks ({new_blocks} unique)")
+        vanilla_ids.update(map(VANILLA_PREFIX.__add__, blocks_list))
+        new_blocks = len(vanilla_ids) - blocks_before
+        print(f"  Loaded {len(blocks_list)} vanilla blocks ({new_blocks} unique)")
     
-    return vanilla_ids
+    return frozenset(vanilla_ids)
+
+# ZIP end-of-central-directory and central directory record layouts
+EOCD_SIGNATURE = b"PK\x05\x06"
+EOCD_STRUCT = struct.Struct("<4s4H2LH")
+CENTRAL_DIR_SIGNATURE = b"PK\x01\x02"
+CENTRAL_DIR_SIZE = 46
+MAX_EOCD_SEARCH = EOCD_STRUCT.size + 0xFFFF  # EOCD plus longest comment
+
+def read_jar_names(jar_path):
+    """
+    List the entry names in a JAR by reading only its central directory.
+    
+    Only names are needed, so this skips building a ZipInfo per entry.
+    Falls back to zipfile for anything unusual (ZIP64, malformed records).
+    """
+    with open(jar_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        file_size = f.tell()
+        tail_start = max(0, file_size - MAX_EOCD_SEARCH)
+        f.seek(tail_start)
+        tail = f.read()
+        
+        eocd_pos = tail.rfind(EOCD_SIGNATURE)
+        if eocd_pos < 0 or len(tail) - eocd_pos < EOCD_STRUCT.size:
+            return None
+        (_, _, _, _, entry_count,
+         cd_size, cd_offset, _) = EOCD_STRUCT.unpack_from(tail, eocd_pos)
+        if entry_count == 0xFFFF or cd_offset == 0xFFFFFFFF:
+            return None  # ZIP64
+        
+        # Measure back from the EOCD so data prepended to the archive is fine
+        cd_start = tail_start + eocd_pos - cd_size
+        if cd_start < 0:
+            return None
+        f.seek(cd_start)
+        central_dir = f.read(cd_size)
+    
+    names = []
+    pos = 0
+    for _ in range(entry_count):
+        if central_dir[pos:pos + 4] != CENTRAL_DIR_SIGNATURE:
+            return None
+        flags = int.from_bytes(central_dir[pos + 8:pos + 10], 'little')
+        name_len = int.from_bytes(central_dir[pos + 28:pos + 30], 'little')
+        extra_len = int.from_bytes(central_dir[pos + 30:pos + 32], 'little')
+        comment_len = int.from_bytes(central_dir[pos + 32:pos + 34], 'little')
+        
+        raw_name = central_dir[pos + CENTRAL_DIR_SIZE:pos + CENTRAL_DIR_SIZE + name_len]
+        # Same name decoding as zipfile: bit 11 marks UTF-8, otherwise cp437
+        names.append(raw_name.decode('utf-8' if flags & 0x800 else 'cp437'))
+        pos += CENTRAL_DIR_SIZE + name_len + extra_len + comment_len
+    
+    return names
 
 def extract_ids_from_jar(jar_path):
-    """Extract item and block IDs from a single JAR file."""
+    """
+    Extract item and block IDs from a single JAR file.
+    Returns None if the JAR couldn't be read.
+    """
     items = set()
     blocks = set()
     
     try:
-        with zipfile.ZipFile(jar_path, 'r') as jar:
-            file_list = jar.namelist()
+        file_list = read_jar_names(jar_path)
+        if file_list is None:
+            with zipfile.ZipFile(jar_path, 'r') as jar:
+                file_list = jar.namelist()
+        
+        # Model files live at assets/<mod_id>/models/<item|block>/<name>.json,
+        # so each entry is only inspected once.
+        for file in file_list:
+            if not file.startswith('assets/') or not file.endswith('.json'):
+                continue
             
-            # Find the mod ID from the assets directory
-            mod_ids = set()
-            for file in file_list:
-                if file.startswith('assets/') and '/' in file[7:]:
-                    parts = file.split('/')
-                    if len(parts) >= 2:
-                        mod_ids.add(parts[1])
+            parts = file.split('/', 4)
+            if len(parts) < 5 or parts[2] != 'models':
+                continue
             
-            # For each mod ID, look for model files
-            for mod_id in mod_ids:
-                item_path_prefix = f'assets/{mod_id}/models/item/'
-                for file in file_list:
-                    if file.startswith(item_path_prefix) and file.endswith('.json'):
-                        item_name = file[len(item_path_prefix):-5]  # Remove path and .json
-                        items.add(f'{mod_id}:{item_name}')
-                
-                block_path_prefix = f'assets/{mod_id}/models/block/'
-                for file in file_list:
-                    if file.startswith(block_path_prefix) and file.endswith('.json'):
-                        block_name = file[len(block_path_prefix):-5]  # Remove path and .json
-                        blocks.add(f'{mod_id}:{block_name}')
+            if parts[3] == 'item':
+                items.add(f'{parts[1]}:{parts[4][:-5]}')  # Remove .json
+            elif parts[3] == 'block':
+                blocks.add(f'{parts[1]}:{parts[4][:-5]}')
     
     except Exception as e:
         print(f"Error processing {jar_path}: {e}")
+        return None
     
     return items, blocks
 
+def load_jar_cache():
+    """Load per-JAR results from previous runs, keyed by (name, size, mtime_ns)."""
+    try:
+        with open(JAR_CACHE_FILE, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        return {}
+
+def save_jar_cache(cache):
+    """Persist per-JAR results for the next run."""
+    CACHE_DIR.mkdir(exist_ok=True)
+    try:
+        with open(JAR_CACHE_FILE, 'wb') as f:
+            pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        print(f"Warning: Could not save JAR cache: {e}")
+
 def scan_modpack_directory(modpack_path):
-    """Scan a modpack directory for all JAR files and extract IDs."""
+    """Scan a modpack directory for all JAR files and extract item and block ID sets."""
     modpack_path = Path(modpack_path)
     mods_dir = modpack_path / 'mods'
     
     if not mods_dir.exists():
         print(f"Mods directory not found at {mods_dir}")
-        return {}, {}
+        return set(), set()
     
-    all_items = defaultdict(set)
-    all_blocks = defaultdict(set)
-    
-    jar_files = list(mods_dir.glob('*.jar'))
+    # DirEntry caches the stat info needed for the JAR cache keys below
+    with os.scandir(mods_dir) as entries:
+        jar_files = [entry for entry in entries
+                     if entry.name.endswith('.jar') and entry.is_file()]
     
     print(f"Found {len(jar_files)} JAR files in mods directory. Processing...")
     
-    for i, jar_file in enumerate(jar_files, 1):
-        print(f"[{i}/{len(jar_files)}] Processing {jar_file.name}...")
-        items, blocks = extract_ids_from_jar(jar_file)
+    # Unchanged JARs reuse results from the last run instead of being reopened
+    old_cache = load_jar_cache()
+    new_cache = {}
+    to_scan = {}
+    # Symlinked JARs can point at the same file; only scan each file once.
+    # DirEntry.stat() reports no inode on Windows, so it can't dedupe there.
+    seen_files = set()
+    
+    for jar_file in jar_files:
+        stat = jar_file.stat()
+        if stat.st_ino:
+            file_id = (stat.st_dev, stat.st_ino)
+            if file_id in seen_files:
+                print(f"  Skipping {jar_file.name}: same file as another JAR")
+                continue
+            seen_files.add(file_id)
         
-        if items or blocks:
-            all_items[jar_file.name].update(items)
-            all_blocks[jar_file.name].update(blocks)
+        key = (jar_file.name, stat.st_size, stat.st_mtime_ns)
+        if key in old_cache:
+            new_cache[key] = old_cache[key]
+        else:
+            to_scan[key] = jar_file
+    
+    print(f"  {len(new_cache)} unchanged since last run, {len(to_scan)} to scan")
+    
+    # Each JAR is independent CPU-bound work, so spread them across processes
+    if to_scan:
+        with ProcessPoolExecutor() as executor:
+            futures = {executor.submit(extract_ids_from_jar, jar_file.path): key
+                       for key, jar_file in to_scan.items()}
+            
+            for i, future in enumerate(as_completed(futures), 1):
+                key = futures[future]
+                result = future.result()
+                if result is None:
+                    # Not cached, so a locked or unreadable JAR is retried next run
+                    print(f"[{i}/{len(to_scan)}] Failed {key[0]}")
+                    continue
+                print(f"[{i}/{len(to_scan)}] Processed {key[0]}")
+                items, blocks = result
+                # Sorted tuples pickle smaller than sets
+                new_cache[key] = (tuple(sorted(items)), tuple(sorted(blocks)))
+        
+        save_jar_cache(new_cache)
+    
+    all_items = set()
+    all_blocks = set()
+    for items, blocks in new_cache.values():
+        all_items.update(items)
+        all_blocks.update(blocks)
     
     return all_items, all_blocks
 
 def save_results(items, blocks, vanilla_ids, output_file='item_ids.txt'):
     """Save extracted IDs to a text file."""
+    # Collect all unique items and blocks from mods
+    all_mod_ids = items | blocks
+    all_ids = sorted(all_mod_ids | vanilla_ids)
+    
     with open(output_file, 'w', encoding='utf-8') as f:
-        # Collect all unique items and blocks from mods
-        all_mod_ids = set()
-        
-        for jar_name, item_set in items.items():
-            all_mod_ids.update(item_set)
-        
-        for jar_name, block_set in blocks.items():
-            all_mod_ids.update(block_set)
-        
-        all_ids = sorted(all_mod_ids | vanilla_ids)
-        
-        for item_id in all_ids:
-            f.write(f"{item_id}\n")
+        f.write("\n".join(all_ids) + "\n")
     
     print(f"\nBreakdown:")
     print(f"  Unique mod items/blocks: {len(all_mod_ids)}")
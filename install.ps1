@@ -28,6 +28,9 @@ if (-not (Test-Path $condaEnvPath)) {
         "sentence-transformers"
         "numpy"
         "gradio"
+        "faiss-cpu"
+        "orjson"
+        "msgspec"
     ) 
     conda run -p $condaEnvPath pip install $pipPackages
 }
@@ -16,7 +16,7 @@ if [ ! -d "$CONDA_ENV_PATH" ]; then
     
     echo "Installing required packages..."
     
-    pip_packages="google-genai google-adk sentence-transformers numpy gradio"
+    pip_packages="google-genai google-adk sentence-transformers numpy gradio faiss-cpu orjson msgspec"
     conda run -p "$CONDA_ENV_PATH" pip install $pip_packages
 fi
 
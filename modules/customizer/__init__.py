@@ -1 +1 @@
-from .grounded_recipe_modifier_agent import root_agent
\ No newline at end of file
+from .grounded_recipe_modifier_agent import root_agent, get_item_searcher, flush_recipe_script
\ No newline at end of file
@@ -1,24 +1,37 @@
 from google.genai import types
 
 from google.adk.agents import LlmAgent, SequentialAgent
+from google.adk.agents.callback_context import CallbackContext
 from google.adk.models.google_llm import Gemini
 from google.adk.runners import Runner
 from google.adk.sessions import InMemorySessionService
-from google.adk.tools import google_search, AgentTool, ToolContext
-from google.adk.code_executors import BuiltInCodeExecutor
-from sentence_transformers import SentenceTransformer
 import numpy as np
-from typing import List, Tuple, Union
+try:
+    import faiss
+except ImportError:
+    faiss = None
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
+if TYPE_CHECKING:
+    # Imported on first use instead, since it pulls in torch
+    from sentence_transformers import SentenceTransformer
+from collections import OrderedDict
 import re
 import json
+import hashlib
+import pickle
 
 import asyncio
+import atexit
+import threading
 
 import os
 from pathlib import Path
 
 # ====== Loading on Module Initialization =====================================
 
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+CACHE_DIR = PROJECT_ROOT / "cache"
+
 def load_valid_item_ids(file_path: str) -> set:
     """Load item IDs from file into a set for O(1) lookup."""
     try:
@@ -29,21 +42,101 @@ def load_valid_item_ids(file_path: str) -> set:
         print(f"Warning: Could not load item IDs from {file_path}: {e}")
         return set()
 
-ITEM_IDS_PATH = Path(__file__).parent.parent.parent / "cache" / "modpack_item_ids.txt"
-VALID_ITEM_IDS = load_valid_item_ids(ITEM_IDS_PATH)
+ITEM_IDS_PATH = CACHE_DIR / "modpack_item_ids.txt"
+VALID_ITEM_IDS = frozenset(load_valid_item_ids(ITEM_IDS_PATH))
 
 def load_recipe_list(file_path: str) -> List[dict]:
-    """Load recipe list into a list"""
+    """
+    Load recipe list into a list.
+    
+    The parsed recipes are also pickled next to the JSON file, which loads
+    many times faster than parsing it. The pickle records the JSON's size
+    and modification time and is only used while both still match.
+    """
+    pickle_path = Path(file_path).with_suffix(".pkl")
     try:
-        with open(file_path, 'r') as file:
-            return json.load(file)
+        stat = Path(file_path).stat()
+    except OSError as e:
+        print(f"Warning: Could not load recipes from {file_path}: {e}")
+        return []
+    source_key = (stat.st_size, stat.st_mtime_ns)
+    
+    try:
+        with open(pickle_path, 'rb') as file:
+            cached = pickle.load(file)
+        if isinstance(cached, tuple) and cached[0] == source_key:
+            return cached[1]
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass # Missing or unreadable; fall back to the JSON
+
+    try:
+        # Binary mode lets json detect the UTF-8 written by the dump catcher
+        with open(file_path, 'rb') as file:
+            recipes = json.load(file)
     except IOError as e:
         print(f"Warning: Could not load recipes from {file_path}: {e}")
         return []
+
+    try:
+        with open(pickle_path, 'wb') as file:
+            pickle.dump((source_key, recipes), file, protocol=pickle.HIGHEST_PROTOCOL)
+    except IOError as e:
+        print(f"Warning: Could not cache recipes to {pickle_path}: {e}")
+    return recipes
     
-RECIPE_LIST_PATH = Path(__file__).parent.parent.parent / "cache" / "dumped_recipes.json"
+RECIPE_LIST_PATH = CACHE_DIR / "dumped_recipes.json"
 ALL_RECIPES = load_recipe_list(RECIPE_LIST_PATH)
 
+def ingredient_item_ids(data: dict) -> List[str]:
+    """Item IDs used as ingredients in a recipe's 'data' block."""
+    # Ingredients can be dicts or lists of dicts (for alternatives)
+    options = data.get("ingredients") # Common in shapeless
+    if options is None:
+        if (key := data.get("key")) is not None: # Common in shaped recipes
+            options = key.values()
+        elif isinstance(ing := data.get("ingredient"), dict): # Common in smelting/stonecutting
+            options = (ing,)
+        else:
+            return []
+
+    item_ids = []
+    append = item_ids.append
+    for ing in options:
+        if isinstance(ing, dict):
+            append(ing.get("item"))
+        elif isinstance(ing, list):
+            for sub_ing in ing:
+                if isinstance(sub_ing, dict):
+                    append(sub_ing.get("item"))
+    return [item_id for item_id in item_ids if isinstance(item_id, str)]
+
+def build_recipe_indexes(recipes: List[dict]) -> Tuple[dict, dict]:
+    """
+    Map each item ID to the indices of the recipes that produce it, and to
+    those that use it as an ingredient, so lookups don't scan every recipe.
+    """
+    result_index: dict[str, list[int]] = {}
+    ingredient_index: dict[str, list[int]] = {}
+
+    for index, recipe in enumerate(recipes):
+        data = recipe.get("data", {})
+
+        res = data.get("result", {})
+        # Handle cases where result might be a simple string (rare) or dict
+        result_id = res.get("item") if isinstance(res, dict) else res
+        if isinstance(result_id, str):
+            result_index.setdefault(result_id, []).append(index)
+
+        # dict.fromkeys drops repeats so each recipe is listed once per item
+        for item_id in dict.fromkeys(ingredient_item_ids(data)):
+            ingredient_index.setdefault(item_id, []).append(index)
+
+    return result_index, ingredient_index
+
+RESULT_INDEX, INGREDIENT_INDEX = build_recipe_indexes(ALL_RECIPES)
+# find_recipes' search_by modes
+RECIPE_INDEXES = {"result": RESULT_INDEX, "ingredient": INGREDIENT_INDEX}
+
 def validate_item_id(item_id: str) -> bool:
     """Check if an item ID is valid. For now, assumes tags are correct."""
     # Handle tags (they start with #)
@@ -52,12 +145,33 @@ def validate_item_id(item_id: str) -> bool:
     
     # Handle item IDs with multiple options (separated by |)
     if '|' in item_id:
-        return all(validate_item_id(id.strip()) for id in item_id.split('|'))
+        return all((option := part.strip()) in VALID_ITEM_IDS or option.startswith('#')
+                   for part in item_id.split('|'))
     
     return item_id in VALID_ITEM_IDS
 
+def find_invalid_item_id(item_ids: List[str]) -> Optional[str]:
+    """
+    Return the first of item_ids that validate_item_id rejects, or None.
+    
+    Every option is checked against VALID_ITEM_IDS in one set difference,
+    so valid recipes (the common case) never validate IDs one at a time.
+    """
+    options = set()
+    for item_id in item_ids:
+        if item_id.startswith('#'):
+            continue
+        if '|' in item_id:
+            options.update(part.strip() for part in item_id.split('|'))
+        else:
+            options.add(item_id)
+    
+    if not any(not option.startswith('#') for option in options.difference(VALID_ITEM_IDS)):
+        return None
+    return next(item_id for item_id in item_ids if not validate_item_id(item_id))
+
 # Load API key from file
-api_key_path = Path(__file__).parent.parent.parent/ "cache" / ".api_key"
+api_key_path = CACHE_DIR / ".api_key"
 with open(api_key_path, 'r') as file:
     os.environ["GOOGLE_API_KEY"] = file.read().strip()
 
@@ -69,17 +183,193 @@ retry_config = types.HttpRetryOptions(
 )
 
 # Set up valid text file.
-OUTPUT_PATH:str = Path(__file__).parent.parent.parent/ "server" / "kubejs" / "server_scripts" / "test.js"
+OUTPUT_PATH:str = PROJECT_ROOT / "server" / "kubejs" / "server_scripts" / "test.js"
 
-if not os.path.exists(OUTPUT_PATH):
-    with open(OUTPUT_PATH, 'x') as file:
+# 'x' creates the file only if it doesn't exist, in one race-free call
+try:
+    with open(OUTPUT_PATH, 'x', newline='\n') as file:
         file.write("ServerEvents.recipes(event =>{\n\n\n})")
-else:
+except FileExistsError:
     print("Repeat test. Make sure the output ends in a line with })!")
 
+# ====== SCRIPT WRITING =======================================================
+
+# Recipe blocks added during a turn, waiting to be written to the output
+# script by flush_recipe_script
+_script_blocks: list[str] = []
+
+def flush_recipe_script() -> dict:
+    """
+    Write the buffered recipe blocks to the output script in place of its
+    closing "})", then close it again.
+    Runs after every agent turn, so the server sees the new recipes.
+    If the write fails, the blocks stay queued and the next flush retries them.
+    """
+    if not _script_blocks:
+        return {"status": "success"}
+
+    error_message = None
+    try:
+        with open(OUTPUT_PATH, 'r+b') as file:
+            # Only the tail is read, so flushing doesn't grow with the script
+            file.seek(0, os.SEEK_END)
+            tail_start = max(0, file.tell() - 64)
+            file.seek(tail_start)
+            closing_index = file.read().rfind(b"})")
+            if closing_index < 0:
+                error_message = "Output script does not end with a closing '})'"
+            else:
+                file.seek(tail_start + closing_index)
+                file.truncate()
+                file.write(("".join(_script_blocks) + "})").encode('utf-8'))
+    except IOError as e:
+        error_message = "Error writing file: " + str(e)
+
+    if error_message is not None:
+        error_message += (f". {len(_script_blocks)} recipe change(s) are still queued"
+                          " and will be written on the next turn once this is fixed")
+        return {"status": "error", "error_message": error_message}
+
+    _script_blocks.clear()
+    return {"status": "success"}
+
+def _flush_at_exit():
+    # Nobody is left to retry, so print what would otherwise be lost
+    flush_result = flush_recipe_script()
+    if flush_result["status"] == "error":
+        print(f"Error: {flush_result['error_message']}")
+        print("Unsaved recipe script:" + "".join(_script_blocks))
+
+atexit.register(_flush_at_exit)
+
+def append_to_script(block: str) -> dict:
+    """
+    Add a block to the output script.
+    
+    Blocks are held in memory until flush_recipe_script at the end of the
+    turn, so a turn that adds many recipes touches the file once.
+    """
+    _script_blocks.append(block)
+    return {"status": "success"}
+
+SHAPELESS_TEMPLATE = (
+    "\n\n// {comment}\n"
+    "event.shapeless(\n"
+    "\tItem.of('{result}', {count}),\n"
+    "\t[\n{ingredients}\n\t]\n"
+    ")\n"
+)
+
+SHAPED_TEMPLATE = (
+    "\n\n// {comment}\n"
+    "event.shaped(\n"
+    "\tItem.of('{result}', {count}),\n"
+    "\t[\n{shape}\n\t],\n"
+    "\t{{\n{keys}\n\t}}\n"
+    ")\n"
+)
+
+SMITHING_TEMPLATE = (
+    "\n\n// {comment}\n"
+    "event.smithing(\n"
+    "\t'{result}',\n"
+    "\t'{template}',\n"
+    "\t'{base}',\n"
+    "\t'{addition}'\n"
+    ")\n"
+)
+
+REPLACE_TEMPLATE = (
+    "\n\n// {comment}\n"
+    "event.{func_name}(\n"
+    "\t{filter},\n"        # Arg 1: Filter
+    "\t'{to_replace}',\n"   # Arg 2: Item to replace
+    "\t'{replace_with}'\n"  # Arg 3: Replacement
+    ")\n"
+)
+
+def format_item_options(item_id: str) -> str:
+    """
+    Format an item ID as the inside of a KubeJS ingredient: 'a' for a
+    single item, or 'a', 'b' for multiple options separated by '|'.
+    """
+    # Check if there are multiple ingredient options
+    if '|' in item_id:
+        return ', '.join(f"'{opt}'" for opt in item_id.split('|'))
+    return f"'{item_id}'"
+
+def format_ingredient(item_id: str) -> str:
+    """Format an item ID as a KubeJS ingredient, in a list if it has options."""
+    if '|' in item_id:
+        return f"[{format_item_options(item_id)}]"
+    return f"'{item_id}'"
+
+def format_shapeless_ingredients(ingredients: dict) -> str:
+    """Format shapeless ingredients as comma-separated lines for SHAPELESS_TEMPLATE."""
+    ingredient_lines = []
+    for key, amount in ingredients.items():
+        if amount == 1:
+            ingredient_lines.append(f"\t\t{format_ingredient(key)}")
+        elif '|' in key:
+            ingredient_lines.append(f"\t\t'{amount}x [{format_item_options(key)}]'")
+        else:
+            ingredient_lines.append(f"\t\t'{amount}x {key}'")
+    return ",\n".join(ingredient_lines)
+
 # ====== TOOL DEFINITIONS =====================================================
 
-def search_item_ids(queries: List[str], top_k_per_query: int = 8) -> dict:
+MAX_RESULTS_PER_QUERY = 15
+# Optional similarity (e.g. 0.95) above which a query reuses a recent query's
+# candidate items, rescored for the new query, instead of rescanning them all.
+# Near-duplicates like "diamond sword" and "sword made of diamond" can still
+# rank different items first, so this trades some recall for speed.
+SEMANTIC_CACHE_THRESHOLD = (float(os.environ["ITEM_SEARCH_SEMANTIC_CACHE"])
+                            if os.environ.get("ITEM_SEARCH_SEMANTIC_CACHE") else None)
+SEARCH_RESULT_CACHE_SIZE = 512
+# Any sentence-transformers model works here, including static-embedding
+# models such as "sentence-transformers/static-retrieval-mrl-en-v1", which
+# skip the transformer forward pass and encode queries far faster
+EMBEDDING_MODEL_NAME = os.environ.get("ITEM_SEARCH_MODEL", "all-MiniLM-L6-v2")
+# Optional ONNX export of the model to run on ONNX Runtime instead of PyTorch,
+# e.g. "onnx/model_qint8_avx512.onnx", an int8-quantized MiniLM that encodes
+# several times faster on CPU. Needs sentence-transformers[onnx].
+EMBEDDING_ONNX_FILE = os.environ.get("ITEM_SEARCH_ONNX_FILE") or None
+# Optional number of dimensions (e.g. 128) to reduce item and query embeddings
+# to with PCA, shrinking the matrix every search scans
+EMBEDDING_PCA_COMPONENTS = (int(os.environ["ITEM_SEARCH_PCA_DIM"])
+                            if os.environ.get("ITEM_SEARCH_PCA_DIM") else None)
+# Optional "fp16" or "int8" to store the FAISS item index at 2 or 1 bytes per
+# dimension instead of 4. Without faiss, "fp16" keeps the numpy item matrix in
+# float16, halving its memory at some cost in speed, and "int8" has no effect.
+EMBEDDING_QUANTIZATION = os.environ.get("ITEM_SEARCH_QUANTIZATION") or None
+
+# The searcher's query caches aren't thread-safe, so worker threads take turns
+_SEARCH_LOCK = threading.Lock()
+
+# Results of recent queries, in LRU order. Always holds the top
+# MAX_RESULTS_PER_QUERY so any smaller top_k can be served by slicing.
+_SEARCH_RESULTS: OrderedDict[str, Tuple[Tuple[str, float], ...]] = OrderedDict()
+
+def _search_batch_locked(queries: List[str], top_k: int) -> List[Tuple[Tuple[str, float], ...]]:
+    """Search for each query, reusing the results of recently repeated queries."""
+    with _SEARCH_LOCK:
+        misses = [query for query in dict.fromkeys(queries)
+                  if query not in _SEARCH_RESULTS]
+        if misses:
+            batch_results = get_item_searcher().search_batch(misses, top_k=MAX_RESULTS_PER_QUERY)
+            for query, results in zip(misses, batch_results):
+                _SEARCH_RESULTS[query] = tuple(results)
+        
+        all_results = []
+        for query in queries:
+            _SEARCH_RESULTS.move_to_end(query)
+            all_results.append(_SEARCH_RESULTS[query][:top_k])
+        
+        while len(_SEARCH_RESULTS) > SEARCH_RESULT_CACHE_SIZE:
+            _SEARCH_RESULTS.popitem(last=False)
+        return all_results
+
+async def search_item_ids(queries: List[str], top_k_per_query: int = 8) -> dict:
     """
     Search for item IDs in the pack relevant to the given queries using semantic search.
     
@@ -104,14 +394,18 @@ def search_item_ids(queries: List[str], top_k_per_query: int = 8) -> dict:
         search_item_ids(["red blocks", "blue blocks"], top_k_per_query=5)
         -> Returns top 5 items for each query
     """
-    top_k_per_query = max(1, min(top_k_per_query, 15))
+    top_k_per_query = max(1, min(top_k_per_query, MAX_RESULTS_PER_QUERY))
     
     try:
         all_results = {}
         all_items = set()
         
-        for query in queries:
-            results = ITEM_SEARCHER.search(query, top_k=top_k_per_query)
+        # Encoding runs in a worker thread (PyTorch releases the GIL), so the
+        # event loop keeps handling other agent events in the meantime
+        batch_results = await asyncio.to_thread(
+            _search_batch_locked, queries, top_k_per_query)
+        
+        for query, results in zip(queries, batch_results):
             
             formatted_results = [
                 {
@@ -147,64 +441,11 @@ def find_recipes(query_item:str, search_by:str):
         query_item: The item string to look for (e.g., 'minecraft:dandelion').
         search_by: Either 'result' or 'ingredient'.
     """
-    matches = []
-    recipes = ALL_RECIPES
-
-    if recipes == []:
+    if ALL_RECIPES == []:
         return {"status": "error", "error_message": "List of recipes is empty!"}
 
-
-    for recipe in recipes:
-        # Safely access the inner 'data' block
-        data = recipe.get("data", {})
-        
-
-        # --- MODE 1: Search by Result --------------
-        if search_by == "result":
-            res = data.get("result", {})
-            # Handle cases where result might be a simple string (rare) or dict
-            if isinstance(res, dict):
-                if res.get("item") == query_item:
-                    matches.append(recipe)
-            elif isinstance(res, str):
-                if res == query_item:
-                    matches.append(recipe)
-
-        # --- MODE 2: Search by Ingredient ----------
-        elif search_by == "ingredient":
-            found = False
-            
-            # Check 'ingredients' list (Common in shapeless)
-            if "ingredients" in data:
-                for ing in data["ingredients"]:
-                    # Ingredients can be dicts or lists of dicts (for alternatives)
-                    if isinstance(ing, dict) and ing.get("item") == query_item:
-                        found = True
-                    elif isinstance(ing, list):
-                        for sub_ing in ing:
-                            if sub_ing.get("item") == query_item:
-                                found = True
-            
-            # Check 'key' dict (Common in shaped recipes)
-            elif "key" in data:
-                for char, ing_data in data["key"].items():
-                    if isinstance(ing_data, dict) and ing_data.get("item") == query_item:
-                        found = True
-                    # sometimes key values are lists (alternatives)
-                    elif isinstance(ing_data, list):
-                        for sub_ing in ing_data:
-                             if sub_ing.get("item") == query_item:
-                                 found = True
-
-            # Check singular 'ingredient' (Common in smelting/stonecutting)
-            elif "ingredient" in data:
-                ing = data["ingredient"]
-                if isinstance(ing, dict) and ing.get("item") == query_item:
-                    found = True
-
-            if found:
-                matches.append(recipe)
-
+    index = RECIPE_INDEXES.get(search_by, {})
+    matches = [ALL_RECIPES[i] for i in index.get(query_item, ())]
     return {"status": "success", "matches": matches}    
 
 
@@ -229,55 +470,16 @@ def add_shapeless_recipe(comment: str, ingredients: dict, result: str,count: int
         count: Amount of result produced. Ex: 1
     """
 
-    for item_id in list(ingredients.keys()) + [result]:
-        if not validate_item_id(item_id):
-            return {"status": "error", "error_message": f"Invalid item ID: {item_id}"}
-
-    try:
-        with open(OUTPUT_PATH, 'r') as file:
-            lines:list[str] = file.readlines()
-    except IOError as e:
-        return {"status": "error", "error_message": ("Error reading file: " + str(e))}
-
-# Remove last line (should be closing "})")        
-    if lines: lines = lines[:-1]
-
+    invalid_id = find_invalid_item_id([*ingredients, result])
+    if invalid_id is not None:
+        return {"status": "error", "error_message": f"Invalid item ID: {invalid_id}"}
 
-
-# Add script to lines
-    lines.append(f"\n\n// {comment}\n")
-    lines.append("event.shapeless(\n")
-    lines.append(f"\tItem.of('{result}', {count}),\n")
-    lines.append("\t[\n")
-    for key in ingredients:
-        # Check if there are multiple ingredient options
-        if '|' in key:
-            ingredient_options = key.split('|')
-            formatted_options = ', '.join(f"'{opt}'" for opt in ingredient_options)
-            if ingredients[key] == 1:
-                lines.append(f"\t\t[{formatted_options}],\n")
-            else:
-                lines.append(f"\t\t'{ingredients[key]}x [{formatted_options}]',\n")
-        else:
-            if ingredients[key] == 1:
-                lines.append(f"\t\t'{key}',\n")
-            else:
-                lines.append(f"\t\t'{ingredients[key]}x {key}',\n")
-    # Remove comma from last ingredient
-    lines[-1] = lines[-1][:-2] + "\n"
-    
-    lines.append("\t]\n")
-    lines.append(")\n")
-    lines.append("})")
-
-# Write back to output file
-    try:
-        with open(OUTPUT_PATH, 'w') as file:
-            file.writelines(lines)
-    except IOError as e:
-        return {"status": "error", "error_message": ("Error writing file: " + str(e))}
-
-    return {"status": "success"}
+    return append_to_script(SHAPELESS_TEMPLATE.format(
+        comment=comment,
+        result=result,
+        count=count,
+        ingredients=format_shapeless_ingredients(ingredients),
+    ))
 
 
 def add_shaped_recipe(comment: str, shape: list[str], ingredients: dict, result: str, count: int) -> dict:
@@ -307,9 +509,9 @@ def add_shaped_recipe(comment: str, shape: list[str], ingredients: dict, result:
     """
     
     
-    for item_id in list(ingredients.keys()) + [result]:
-        if not validate_item_id(item_id):
-            return {"status": "error", "error_message": f"Invalid item ID: {item_id}"}
+    invalid_id = find_invalid_item_id([*ingredients, result])
+    if invalid_id is not None:
+        return {"status": "error", "error_message": f"Invalid item ID: {invalid_id}"}
 
 
     validation = validate_shaped_recipe(shape, ingredients)
@@ -317,56 +519,14 @@ def add_shaped_recipe(comment: str, shape: list[str], ingredients: dict, result:
         return {"status": "error", "error_message": validation["error_message"]}
 
     
-    try:
-        with open(OUTPUT_PATH, 'r') as file:
-            lines: list[str] = file.readlines()
-    except IOError as e:
-        return {"status": "error", "error_message": ("Error reading file: " + str(e))}
-    
-    # Remove last line (should be closing "})")        
-    if lines: 
-        lines = lines[:-1]
-
-
-    # Add script to lines
-    lines.append(f"\n\n// {comment}\n")
-    lines.append("event.shaped(\n")
-    lines.append(f"\tItem.of('{result}', {count}),\n")
-    lines.append("\t[\n")
-    
-    # Add shape pattern
-    for row in shape:
-        lines.append(f"\t\t'{row}',\n")
-    # Remove comma from last row
-    lines[-1] = lines[-1][:-2] + "\n"
-    
-    lines.append("\t],\n")
-    lines.append("\t{\n")
-    
-    # Add ingredient mappings
-    for key, letter in ingredients.items():
-        # Check if there are multiple ingredient options
-        if '|' in key:
-            ingredient_options = key.split('|')
-            formatted_options = ', '.join(f"'{opt}'" for opt in ingredient_options)
-            lines.append(f"\t\t{letter}: [{formatted_options}],\n")
-        else:
-            lines.append(f"\t\t{letter}: '{key}',\n")
-    
-    # Remove comma from last ingredient
-    lines[-1] = lines[-1][:-2] + "\n"
-    
-    lines.append("\t}\n")
-    lines.append(")\n")
-    lines.append("})")
-
-    try:
-        with open(OUTPUT_PATH, 'w') as file:
-            file.writelines(lines)
-    except IOError as e:
-        return {"status": "error", "error_message": ("Error writing file: " + str(e))}
-
-    return {"status": "success"}
+    return append_to_script(SHAPED_TEMPLATE.format(
+        comment=comment,
+        result=result,
+        count=count,
+        shape=",\n".join(f"\t\t'{row}'" for row in shape),
+        keys=",\n".join(f"\t\t{letter}: {format_ingredient(key)}"
+                        for key, letter in ingredients.items()),
+    ))
 
 
 def add_smithing_recipe(comment: str, template: str, base: str, addition: str, result: str) -> dict:
@@ -390,40 +550,17 @@ def add_smithing_recipe(comment: str, template: str, base: str, addition: str, r
         Ex: "minecraft:netherite_ingot"
     """
 
-    for item_id in [template, base, addition, result]:
-        if not validate_item_id(item_id):
-            return {"status": "error", "error_message": f"Invalid item ID: {item_id}"}    
-
-    try:
-        with open(OUTPUT_PATH, 'r') as file:
-            lines: list[str] = file.readlines()
-    except IOError as e:
-        return {"status": "error", "error_message": ("Error reading file: " + str(e))}
-    
-    # Remove last line (should be closing "})")        
-    if lines: 
-        lines = lines[:-1]
-
-
-
-    # Add script to lines
-    lines.append(f"\n\n// {comment}\n")
-    lines.append("event.smithing(\n")
-    lines.append(f"\t'{result}',\n")
-    lines.append(f"\t'{template}',\n")
-    lines.append(f"\t'{base}',\n")
-    lines.append(f"\t'{addition}'\n")
-    lines.append(")\n")
-    lines.append("})")
-
+    invalid_id = find_invalid_item_id([template, base, addition, result])
+    if invalid_id is not None:
+        return {"status": "error", "error_message": f"Invalid item ID: {invalid_id}"}
 
-    try:
-        with open(OUTPUT_PATH, 'w') as file:
-            file.writelines(lines)
-    except IOError as e:
-        return {"status": "error", "error_message": ("Error writing file: " + str(e))}
-
-    return {"status": "success"}
+    return append_to_script(SMITHING_TEMPLATE.format(
+        comment=comment,
+        result=result,
+        template=template,
+        base=base,
+        addition=addition,
+    ))
 
 
 def add_cooking_recipe(comment: str, ingredient: str, result: str, methods: list[str], xp: float = 0.35, cooking_time: int = 200) -> dict:
@@ -455,9 +592,9 @@ def add_cooking_recipe(comment: str, ingredient: str, result: str, methods: list
         Value given will be used for smelting; it will be halved in smoker/blast furnace and tripled for campfire.
     """
     
-    for item_id in [ingredient, result]:
-        if not validate_item_id(item_id):
-            return {"status": "error", "error_message": f"Invalid item ID: {item_id}"}
+    invalid_id = find_invalid_item_id([ingredient, result])
+    if invalid_id is not None:
+        return {"status": "error", "error_message": f"Invalid item ID: {invalid_id}"}
 
     # Validate methods
     valid_methods = {'smelt', 'blast', 'smoke', 'fire'}
@@ -469,17 +606,6 @@ def add_cooking_recipe(comment: str, ingredient: str, result: str, methods: list
             return {"status": "error", "error_message": f"Invalid method '{method}'. Must be one of: {valid_methods}"}
     
     
-    try:
-        with open(OUTPUT_PATH, 'r') as file:
-            lines: list[str] = file.readlines()
-    except IOError as e:
-        return {"status": "error", "error_message": ("Error reading file: " + str(e))}
-    
-    # Remove last line (should be closing "})")        
-    if lines: 
-        lines = lines[:-1]
-
-
     # Map method names to KubeJS function names
     method_map = {
         'smelt': 'smelting',
@@ -488,16 +614,11 @@ def add_cooking_recipe(comment: str, ingredient: str, result: str, methods: list
         'fire': 'campfireCooking'
     }
 
-    lines.append(f"\n\n// {comment}\n")
-    # Add script to lines for each method
+    ingredient_str = format_ingredient(ingredient)
+
+    # Add a line for each method
+    method_lines = []
     for method in methods:
-        if '|' in ingredient:
-            ingredient_options = ingredient.split('|')
-            formatted_options = ', '.join(f"'{opt}'" for opt in ingredient_options)
-            ingredient_str = f"[{formatted_options}]"
-        else:
-            ingredient_str = f"'{ingredient}'"
-        
         # Calculate time factor based on method
         time_factor = 1.0
         if method in ['blast', 'smoke']:
@@ -506,22 +627,10 @@ def add_cooking_recipe(comment: str, ingredient: str, result: str, methods: list
             time_factor = 3.0
         
         # Use method chaining approach
-        lines.append(f"event.{method_map[method]}('{result}', {ingredient_str})")
-        
-        lines.append(f".xp({xp})")
-        lines.append(f".cookingTime({int(cooking_time * time_factor)})")
-        lines.append("\n")
-    
-    lines.append("})")
-
+        method_lines.append(f"event.{method_map[method]}('{result}', {ingredient_str})"
+                            f".xp({xp}).cookingTime({int(cooking_time * time_factor)})\n")
 
-    try:
-        with open(OUTPUT_PATH, 'w') as file:
-            file.writelines(lines)
-    except IOError as e:
-        return {"status": "error", "error_message": ("Error writing file: " + str(e))}
-
-    return {"status": "success"}
+    return append_to_script(f"\n\n// {comment}\n" + "".join(method_lines))
 
 
 def add_stonecutting_recipe(comment: str, ingredient: str, result: str, count: int) -> dict:
@@ -541,41 +650,19 @@ def add_stonecutting_recipe(comment: str, ingredient: str, result: str, count: i
         count: Amount of result produced. Ex: 3
     """
     
-    for item_id in [ingredient, result]:
-        if not validate_item_id(item_id):
-            return {"status": "error", "error_message": f"Invalid item ID: {item_id}"}
+    invalid_id = find_invalid_item_id([ingredient, result])
+    if invalid_id is not None:
+        return {"status": "error", "error_message": f"Invalid item ID: {invalid_id}"}
 
 
     
-    try:
-        with open(OUTPUT_PATH, 'r') as file:
-            lines: list[str] = file.readlines()
-    except IOError as e:
-        return {"status": "error", "error_message": ("Error reading file: " + str(e))}
-    
-    # Remove last line (should be closing "})")        
-    if lines: 
-        lines = lines[:-1]
-
     # Format result with count
     if count > 1:
         result_str = f"'{count}x {result}'"
     else:
         result_str = f"'{result}'"
 
-    # Add script to lines
-    lines.append(f"\n\n// {comment}\n")
-    lines.append(f"event.stonecutting({result_str}, '{ingredient}')\n")
-    lines.append("})")
-
-
-    try:
-        with open(OUTPUT_PATH, 'w') as file:
-            file.writelines(lines)
-    except IOError as e:
-        return {"status": "error", "error_message": ("Error writing file: " + str(e))}
-
-    return {"status": "success"}
+    return append_to_script(f"\n\n// {comment}\nevent.stonecutting({result_str}, '{ingredient}')\n")
 
 
 def remove_recipes(comment: str, filters: dict) -> dict:
@@ -603,31 +690,10 @@ def remove_recipes(comment: str, filters: dict) -> dict:
             return {"status": "error", "error_message": f"Invalid input item ID: {filters['input']}"}
 
     
-    try:
-        with open(OUTPUT_PATH, 'r') as file:
-            lines: list[str] = file.readlines()
-    except IOError as e:
-        return {"status": "error", "error_message": ("Error reading file: " + str(e))}
-    
-    # Remove last line (should be closing "})")        
-    if lines: 
-        lines = lines[:-1]
-
     # Convert filter dict to JSON string
     filter_str = json.dumps(filters)
 
-    lines.append(f"\n\n// {comment}\n")
-    lines.append(f"event.remove({filter_str})\n")
-    lines.append("})")
-
-
-    try:
-        with open(OUTPUT_PATH, 'w') as file:
-            file.writelines(lines)
-    except IOError as e:
-        return {"status": "error", "error_message": ("Error writing file: " + str(e))}
-
-    return {"status": "success"}
+    return append_to_script(f"\n\n// {comment}\nevent.remove({filter_str})\n")
 
 
 def replace_recipe_items(comment: str, type: str, to_replace: str, replace_with: str, filter_criteria: dict) -> dict:
@@ -653,48 +719,28 @@ def replace_recipe_items(comment: str, type: str, to_replace: str, replace_with:
         return {"status": "error", "error_message": "Type must be 'input' or 'output'"}
 
     
-    for item_id in [to_replace, replace_with]:
-        if not validate_item_id(item_id):
-            return {"status": "error", "error_message": f"Invalid item ID: {item_id}"}
+    invalid_id = find_invalid_item_id([to_replace, replace_with])
+    if invalid_id is not None:
+        return {"status": "error", "error_message": f"Invalid item ID: {invalid_id}"}
 
     
-    try:
-        with open(OUTPUT_PATH, 'r') as file:
-            lines: list[str] = file.readlines()
-    except IOError as e:
-        return {"status": "error", "error_message": ("Error reading file: " + str(e))}
-    
-    # Remove last line (should be closing "})")        
-    if lines: 
-        lines = lines[:-1]
-
-    # Construct the KubeJS function name
-    func_name = "replaceInput" if type == "input" else "replaceOutput"
-
-    # Convert filter dict to JSON string for JS compatibility
-    filter_str = json.dumps(filter_criteria)
-
-    lines.append(f"\n\n// {comment}\n")
-    lines.append(f"event.{func_name}(\n")
-    lines.append(f"\t{filter_str},\n")       # Arg 1: Filter
-    lines.append(f"\t'{to_replace}',\n")      # Arg 2: Item to replace
-    lines.append(f"\t'{replace_with}'\n")     # Arg 3: Replacement
-    lines.append(")\n")
-    lines.append("})")
-
-
-    try:
-        with open(OUTPUT_PATH, 'w') as file:
-            file.writelines(lines)
-    except IOError as e:
-        return {"status": "error", "error_message": ("Error writing file: " + str(e))}
-
-    return {"status": "success"}
+    return append_to_script(REPLACE_TEMPLATE.format(
+        comment=comment,
+        # Construct the KubeJS function name
+        func_name="replaceInput" if type == "input" else "replaceOutput",
+        # Convert filter dict to JSON string for JS compatibility
+        filter=json.dumps(filter_criteria),
+        to_replace=to_replace,
+        replace_with=replace_with,
+    ))
 
 # ====== VALIDATOR HELPER FUNCTIONS ===========================================
 
 
 
+SHAPE_CHARS = frozenset('ABCDEFGHI ')
+SHAPE_ROW_PATTERN = re.compile(r'[A-I ]{1,3}')
+
 def validate_shaped_recipe(shape: list[str], ingredients: dict) -> dict:
     """Validates the shape and ingredients for a shaped recipe.
     
@@ -715,18 +761,17 @@ def validate_shaped_recipe(shape: list[str], ingredients: dict) -> dict:
         if not isinstance(row, str):
             return {"valid": False, "error_message": f"Row {i} must be a string"}
         
+        # Valid rows pass in a single match; the rest work out what's wrong
+        if SHAPE_ROW_PATTERN.fullmatch(row):
+            continue
+        
         if len(row) < 1 or len(row) > 3:
             return {"valid": False, "error_message": f"Row {i} must be 1-3 characters long"}
         
-        for char in row:
-            if char not in 'ABCDEFGHI ':
-                return {"valid": False, "error_message": f"Row {i} contains invalid character '{char}'. Only A-I and spaces are allowed"}
+        char = next(char for char in row if char not in SHAPE_CHARS)
+        return {"valid": False, "error_message": f"Row {i} contains invalid character '{char}'. Only A-I and spaces are allowed"}
     
-    letters_in_shape = set()
-    for row in shape:
-        for char in row:
-            if char != ' ':
-                letters_in_shape.add(char)
+    letters_in_shape = set(''.join(shape)) - {' '}
     
     if not isinstance(ingredients, dict):
         return {"valid": False, "error_message": "Ingredients must be a dictionary"}
@@ -802,45 +847,348 @@ recipe_modifier_agent = LlmAgent(
            ],
     )
 
+def flush_after_turn(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    Write the turn's recipes once the pipeline finishes, whatever is running
+    it (the UI, main() or adk web). A failed write is reported in the reply.
+    """
+    flush_result = flush_recipe_script()
+    if flush_result["status"] == "error":
+        return types.Content(role="model", parts=[types.Part(
+            text=f"\n\nError: {flush_result['error_message']}")])
+    return None
+
 root_agent = SequentialAgent(
     name="RecipeModifierPipeline",
-    sub_agents=[searcher_agent,recipe_modifier_agent]
+    sub_agents=[searcher_agent,recipe_modifier_agent],
+    after_agent_callback=flush_after_turn
 )
 
 # ====== RAG SETUP ============================================================
 
+_MODEL_CACHE: dict[Tuple[str, Optional[str]], "SentenceTransformer"] = {}
+# The UI warms the model up in a background thread while the first search
+# may already be loading it, so loads are serialized
+_MODEL_CACHE_LOCK = threading.Lock()
+
+# Maps the separators in item IDs to spaces in a single pass
+ITEM_TEXT_TABLE = str.maketrans({':': ' ', '_': ' '})
+
+def get_embedding_model(model_name: str, onnx_file: Optional[str] = None) -> "SentenceTransformer":
+    """
+    Load a sentence-transformer model once and share it between callers.
+    If onnx_file is set, that ONNX export of the model is run on ONNX Runtime.
+    """
+    with _MODEL_CACHE_LOCK:
+        model = _MODEL_CACHE.get((model_name, onnx_file))
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+            
+            print("Loading embedding model for item search...")
+            if onnx_file is not None:
+                model = SentenceTransformer(model_name, backend="onnx",
+                                            model_kwargs={"file_name": onnx_file})
+            else:
+                model = SentenceTransformer(model_name)
+                if model.device.type == "cuda":
+                    # Half precision roughly doubles GPU throughput; scores are
+                    # still normalized and compared in float32
+                    model.half()
+            _MODEL_CACHE[(model_name, onnx_file)] = model
+    return model
+
 class ItemIDSearcher:
     """Semantic search for Minecraft item IDs using embeddings."""
     
-    def __init__(self, item_ids: List[str], model_name: str = "all-MiniLM-L6-v2"):
+    # Embeddings are ~1.5 KB per query, so many can be kept cheaply; the
+    # semantic cache is smaller because each lookup scans all of its entries
+    QUERY_CACHE_SIZE = 1024
+    SEMANTIC_CACHE_SIZE = 256
+    # Above this many items, FAISS uses an HNSW graph instead of a full scan
+    HNSW_MIN_ITEMS = 100_000
+    HNSW_NEIGHBORS = 32
+    # HNSW candidates kept per search; must cover the largest top_k asked for
+    HNSW_EF_SEARCH = 64
+    # Rows of a float16 item matrix upcast at a time (4096 x 384 x 4 B = 6 MB)
+    SCORE_TILE_ROWS = 4096
+    # Item IDs are only a few tokens long, so large batches cost little padding
+    # (encode sorts its inputs by length before batching)
+    ITEM_ENCODE_BATCH_SIZE = 256
+    
+    def __init__(self, item_ids: Iterable[str], model_name: str = "all-MiniLM-L6-v2",
+                 semantic_cache_threshold: Optional[float] = None,
+                 cache_dir: Optional[Path] = None,
+                 model: Optional["SentenceTransformer"] = None,
+                 pca_components: Optional[int] = None,
+                 quantization: Optional[str] = None,
+                 use_hnsw: Optional[bool] = None,
+                 onnx_file: Optional[str] = None):
         """
         Initialize the searcher with item IDs.
         
         Args:
-            item_ids: List of valid item IDs
+            item_ids: Valid item IDs, in any order
             model_name: Name of the sentence-transformer model to use
+            semantic_cache_threshold: If set, a query whose embedding has at
+                least this cosine similarity to a recent query rescores that
+                query's results instead of scanning every item. None disables
+                the semantic cache.
+            cache_dir: If set, item embeddings are saved here and reloaded on
+                later runs with the same model and item IDs.
+            model: An already loaded model to use instead of model_name's
+                shared instance. model_name is still used as the cache key.
+            pca_components: If set, item and query embeddings are projected
+                onto this many principal components of the item embeddings,
+                shrinking the matrix scanned by every search. None keeps the
+                model's full dimension.
+            quantization: "fp16" or "int8" to store the item embeddings at
+                reduced precision, halving or quartering the memory each
+                search reads. "int8" needs faiss; without faiss, "fp16"
+                keeps the numpy matrix in float16. None keeps float32.
+            use_hnsw: Whether the FAISS index is an approximate HNSW graph,
+                which answers in roughly log(N) time instead of scanning
+                every item. None uses HNSW only above HNSW_MIN_ITEMS items.
+            onnx_file: If set, the model's ONNX export at this path in the
+                model repo is used instead of its PyTorch weights.
         """
-        print("Loading embedding model for item search...")
-        self.model = SentenceTransformer(model_name)
-        self.item_ids = list(item_ids)
+        if quantization not in (None, "fp16", "int8"):
+            raise ValueError(f"Unknown quantization '{quantization}'. Must be 'fp16', 'int8' or None")
+        # Loaded on first use, so a warm embedding cache skips it at startup
+        self.model_name = model_name
+        self.onnx_file = onnx_file
+        self._model = model
+        # Sorted so row order, and with it the embedding cache, is reproducible
+        self.item_ids = tuple(sorted(item_ids))
+        
+        # Embeddings depend only on the model and the set of item IDs;
+        # quantized ONNX exports embed slightly differently, so they get their own
+        model_key = model_name if onnx_file is None else f"{model_name}:{onnx_file}"
+        cache_key = hashlib.sha1(
+            (model_key + "\n" + "\n".join(self.item_ids)).encode('utf-8')
+        ).hexdigest()[:16]
+        embeddings_path = None
+        if cache_dir is not None and self.item_ids:
+            embeddings_path = Path(cache_dir) / f"item_embeddings_{cache_key}.npy"
+        
+        # Rows are in item_ids order, which the cache key already pins down
+        self.embeddings_norm = None
+        if embeddings_path is not None and embeddings_path.exists():
+            print(f"Loading cached embeddings from {embeddings_path}...")
+            embeddings = np.load(embeddings_path, mmap_mode='r')
+            if embeddings.ndim == 2 and len(embeddings) == len(self.item_ids):
+                if embeddings.dtype != np.float32 or not embeddings.flags.c_contiguous:
+                    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+                self.embeddings_norm = embeddings
+            else:
+                print("Cached embeddings don't match the item IDs, recomputing...")
+                del embeddings # Unmapped so Windows lets the cache be replaced below
+        
+        if self.embeddings_norm is None:
+            self.embeddings_norm = self._compute_embeddings()
+            if embeddings_path is not None:
+                # Written to a temporary file and renamed into place, so another
+                # process starting up never maps a partially written cache
+                embeddings_tmp = embeddings_path.with_name(f"{embeddings_path.name}.{os.getpid()}.tmp")
+                try:
+                    with open(embeddings_tmp, 'wb') as file:
+                        np.save(file, self.embeddings_norm)
+                    os.replace(embeddings_tmp, embeddings_path)
+                    # Caches for other models or item lists would otherwise pile up
+                    self._remove_stale_caches(embeddings_path, "item_embeddings_*.npy")
+                except IOError as e:
+                    print(f"Warning: Could not cache item embeddings: {e}")
+        
+        # Principal axes fitted to the items, or None to search at full dimension
+        self._pca_mean = self._pca_components = None
+        if pca_components is not None and 0 < pca_components < min(self.embeddings_norm.shape):
+            self._fit_pca(pca_components)
+        
+        # Exact-match cache of normalized query embeddings, in LRU order
+        self._query_cache: OrderedDict[str, np.ndarray] = OrderedDict()
+        
+        # FAISS searches with SIMD kernels and heap-based top-k; without it,
+        # search_batch falls back to numpy
+        self.index = None
+        if faiss is not None and self.item_ids:
+            if use_hnsw is None:
+                use_hnsw = len(self.item_ids) >= self.HNSW_MIN_ITEMS
+            if cache_dir is not None and hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+                # The name covers everything besides the items that changes the index
+                index_name = (f"item_index_{cache_key}_{self.embeddings_norm.shape[1]}"
+                              f"_{quantization or 'flat'}{f'_hnsw{self.HNSW_NEIGHBORS}' if use_hnsw else ''}.faiss")
+                self.index = self._load_index(Path(cache_dir) / index_name, quantization, use_hnsw)
+            else:
+                self.index = self._build_index(quantization, use_hnsw)
+        elif quantization == "fp16":
+            self.embeddings_norm = self.embeddings_norm.astype(np.float16)
         
+        # Reused across searches so scoring doesn't allocate an N-wide row per query
+        self._similarities = np.empty((0, len(self.item_ids)), dtype=np.float32)
+        
+        # Ring buffer of recent query embeddings and the item indices they found
+        self.semantic_cache_threshold = semantic_cache_threshold
+        self._semantic_embeddings = np.zeros(
+            (self.SEMANTIC_CACHE_SIZE, self.embeddings_norm.shape[1]), dtype=np.float32)
+        self._semantic_results: List[np.ndarray] = []
+        self._semantic_next = 0
+        print("Item embeddings ready!")
+    
+    def _compute_embeddings(self) -> np.ndarray:
+        """Encode all item IDs and L2-normalize the rows."""
         # Precompute embeddings for all item IDs
         # Transform IDs to be more human-readable for embedding
-        self.item_texts = [self._format_item_for_embedding(item_id) 
-                          for item_id in self.item_ids]
+        self.item_texts = list(map(self._format_item_for_embedding, self.item_ids))
         
+        model = self.model
         print(f"Computing embeddings for {len(self.item_ids)} items...")
-        self.embeddings = self.model.encode(self.item_texts, show_progress_bar=True)
+        embeddings = model.encode(self.item_texts, batch_size=self.ITEM_ENCODE_BATCH_SIZE,
+                                  show_progress_bar=True)
+        # An empty item list encodes to a 1-D empty array
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(
+            len(self.item_ids), model.get_sentence_embedding_dimension())
+        
+        # Normalize once so cosine similarity is a single matrix-vector product.
+        # Done in place, in float32 even when the model ran in half precision.
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        embeddings /= norms
+        return embeddings
+    
+    @property
+    def model(self) -> "SentenceTransformer":
+        """The embedding model, loaded the first time something is encoded."""
+        if self._model is None:
+            self._model = get_embedding_model(self.model_name, self.onnx_file)
+        return self._model
+    
+    def warm_up(self) -> None:
+        """Load the embedding model now, so the first search doesn't wait on it."""
+        self.model
         print("Item search ready!")
     
+    @staticmethod
+    def _remove_stale_caches(current_path: Path, pattern: str) -> None:
+        """Delete the files beside current_path that match pattern, except current_path itself."""
+        for path in current_path.parent.glob(pattern):
+            if path != current_path:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass # Still mapped by another process on Windows
+    
+    def _build_index(self, quantization: Optional[str], use_hnsw: bool) -> "faiss.Index":
+        """Build a FAISS inner-product index over the item embeddings."""
+        embeddings = np.ascontiguousarray(self.embeddings_norm, dtype=np.float32)
+        dimension = embeddings.shape[1]
+        metric = faiss.METRIC_INNER_PRODUCT
+        
+        if quantization is None:
+            if use_hnsw:
+                index = faiss.IndexHNSWFlat(dimension, self.HNSW_NEIGHBORS, metric)
+            else:
+                index = faiss.IndexFlatIP(dimension)
+        else:
+            # Scalar quantizers decode with SIMD as they scan, so scores
+            # come out in float32 without a dequantized copy of the matrix
+            quantizer_type = (faiss.ScalarQuantizer.QT_fp16 if quantization == "fp16"
+                              else faiss.ScalarQuantizer.QT_8bit)
+            if use_hnsw:
+                index = faiss.IndexHNSWSQ(dimension, quantizer_type, self.HNSW_NEIGHBORS, metric)
+            else:
+                index = faiss.IndexScalarQuantizer(dimension, quantizer_type, metric)
+            index.train(embeddings) # Learns the per-dimension int8 ranges
+        
+        if use_hnsw:
+            index.hnsw.efSearch = self.HNSW_EF_SEARCH
+        index.add(embeddings)
+        return index
+    
+    def _load_index(self, index_path: Path, quantization: Optional[str], use_hnsw: bool) -> "faiss.Index":
+        """
+        Memory-map the FAISS index saved at index_path, building and saving it
+        first if needed. Mapped read-only, its pages come from the OS page
+        cache and are shared by every process searching the same items.
+        """
+        if index_path.exists():
+            index = self._map_index(index_path)
+            if index is not None:
+                if use_hnsw:
+                    index.hnsw.efSearch = self.HNSW_EF_SEARCH
+                return index
+        
+        index = self._build_index(quantization, use_hnsw)
+        # Renamed into place, like the embeddings, so nobody maps a partial file
+        index_tmp = index_path.with_name(f"{index_path.name}.{os.getpid()}.tmp")
+        try:
+            faiss.write_index(index, str(index_tmp))
+            os.replace(index_tmp, index_path)
+        except (IOError, RuntimeError) as e:
+            print(f"Warning: Could not cache item index: {e}")
+            return index
+        self._remove_stale_caches(index_path, "item_index_*.faiss")
+        
+        # Swapped for the mapped copy so this process shares it too
+        mapped_index = self._map_index(index_path)
+        if mapped_index is None:
+            return index
+        if use_hnsw:
+            mapped_index.hnsw.efSearch = self.HNSW_EF_SEARCH
+        return mapped_index
+    
+    def _map_index(self, index_path: Path) -> Optional["faiss.Index"]:
+        """Memory-map a saved FAISS index, or return None if it's unusable."""
+        try:
+            index = faiss.read_index(str(index_path), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            print(f"Could not load cached item index ({e}), rebuilding...")
+            return None
+        if index.ntotal != len(self.item_ids) or index.d != self.embeddings_norm.shape[1]:
+            print("Cached item index doesn't match the item IDs, rebuilding...")
+            return None
+        return index
+    
+    def _fit_pca(self, n_components: int) -> None:
+        """Fit PCA to the item embeddings and replace them with their projection."""
+        print(f"Reducing item embeddings to {n_components} dimensions...")
+        embeddings = np.asarray(self.embeddings_norm, dtype=np.float32)
+        self._pca_mean = embeddings.mean(axis=0)
+        # Rows of vt are the principal axes, largest variance first
+        _, _, vt = np.linalg.svd(embeddings - self._pca_mean, full_matrices=False)
+        self._pca_components = np.ascontiguousarray(vt[:n_components].T)
+        self.embeddings_norm = self._project(embeddings)
+    
+    def _project(self, embeddings: np.ndarray) -> np.ndarray:
+        """Project embeddings onto the fitted principal axes and re-normalize them."""
+        reduced = (embeddings - self._pca_mean) @ self._pca_components
+        norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return np.ascontiguousarray(reduced / norms, dtype=np.float32)
+    
     def _format_item_for_embedding(self, item_id: str) -> str:
         """
         Convert item ID to more semantic text for better embedding.
         
         Example: 'minecraft:diamond_sword' -> 'minecraft diamond sword'
         """
-        formatted = item_id.replace(':', ' ').replace('_', ' ')
-        return formatted
+        return item_id.translate(ITEM_TEXT_TABLE)
+    
+    @staticmethod
+    def _top_k(similarities: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Scores and indices of the top_k highest similarities in each row,
+        best first.
+        
+        np.argpartition selects the top k of every row in O(N) at once, so
+        only those k get sorted rather than the whole corpus.
+        """
+        if top_k < similarities.shape[1]:
+            candidates = np.argpartition(similarities, -top_k, axis=1)[:, -top_k:]
+        else:
+            candidates = np.broadcast_to(np.arange(similarities.shape[1]), similarities.shape)
+        candidate_scores = np.take_along_axis(similarities, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        return (np.take_along_axis(candidate_scores, order, axis=1),
+                np.take_along_axis(candidates, order, axis=1))
     
     def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
         """
@@ -853,21 +1201,161 @@ class ItemIDSearcher:
         Returns:
             List of (item_id, similarity_score) tuples, sorted by relevance
         """
-        query_embedding = self.model.encode([query])[0]
+        return self.search_batch([query], top_k)[0]
+    
+    def search_batch(self, queries: List[str], top_k: int = 10) -> List[List[Tuple[str, float]]]:
+        """
+        Search for item IDs relevant to each of several queries at once.
         
-        # Compute cosine similarities
-        similarities = np.dot(self.embeddings, query_embedding) / (
-            np.linalg.norm(self.embeddings, axis=1) * np.linalg.norm(query_embedding)
-        )
+        All queries are encoded in one forward pass and scored against the
+        items with a single matrix multiplication.
         
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
+        Args:
+            queries: Natural language search queries
+            top_k: Number of results to return per query
+            
+        Returns:
+            One list of (item_id, similarity_score) tuples per query, each
+            sorted by relevance
+        """
+        top_k = min(top_k, len(self.item_ids))
+        if top_k <= 0:
+            return [[] for _ in queries]
+        
+        query_embeddings = self._encode_queries(queries)
+        
+        all_results = self._semantic_lookup(query_embeddings, top_k)
+        pending = [i for i, results in enumerate(all_results) if results is None]
+        if not pending:
+            return all_results
+        
+        if self.index is not None:
+            scores, indices = self.index.search(query_embeddings[pending], top_k)
+        else:
+            # Compute cosine similarities, one row per query. Both operands are
+            # C-contiguous float32, so this is a single sgemm; the transpose is a
+            # view that BLAS reads directly, with no copy of the item matrix.
+            similarities = self._similarity_buffer(len(pending))
+            if self.embeddings_norm.dtype == np.float32:
+                np.matmul(query_embeddings[pending], self.embeddings_norm.T, out=similarities)
+            else:
+                self._score_tiles(query_embeddings[pending], similarities)
+            scores, indices = self._top_k(similarities, top_k)
+        
+        for i, row_scores, top_indices in zip(pending, scores.tolist(), indices.tolist()):
+            # HNSW pads with -1 when it finds fewer than top_k neighbours
+            results = [(self.item_ids[idx], score)
+                       for idx, score in zip(top_indices, row_scores) if idx >= 0]
+            self._semantic_store(query_embeddings[i], [idx for idx in top_indices if idx >= 0])
+            all_results[i] = results
+        return all_results
+    
+    def _score_tiles(self, query_embeddings: np.ndarray, out: np.ndarray) -> None:
+        """
+        Score queries against a float16 item matrix. numpy has no float16
+        BLAS, so rows are upcast a tile at a time and scored with sgemm.
+        """
+        for start in range(0, len(self.item_ids), self.SCORE_TILE_ROWS):
+            tile = self.embeddings_norm[start:start + self.SCORE_TILE_ROWS].astype(np.float32)
+            np.matmul(query_embeddings, tile.T, out=out[:, start:start + len(tile)])
+    
+    def _similarity_buffer(self, rows: int) -> np.ndarray:
+        """A float32 buffer for the similarities of `rows` queries, grown as needed."""
+        if len(self._similarities) < rows:
+            self._similarities = np.empty((rows, len(self.item_ids)), dtype=np.float32)
+        return self._similarities[:rows]
+    
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Encode and normalize queries, reusing embeddings of recent queries.
+        Queries are keyed with whitespace collapsed, so retries that differ
+        only in spacing share an entry. Uncached queries are encoded together
+        in one batch.
+        """
+        queries = [" ".join(query.split()) for query in queries]
+        misses = [query for query in dict.fromkeys(queries)
+                  if query not in self._query_cache]
+        if misses:
+            encoded = np.asarray(
+                self.model.encode(misses, normalize_embeddings=True), dtype=np.float32)
+            if self._pca_components is not None:
+                encoded = self._project(encoded)
+            for query, embedding in zip(misses, encoded):
+                self._query_cache[query] = embedding
         
-        results = [(self.item_ids[idx], float(similarities[idx])) 
-                   for idx in top_indices]
-        return results
+        embeddings = np.empty((len(queries), self.embeddings_norm.shape[1]), dtype=np.float32)
+        for i, query in enumerate(queries):
+            embeddings[i] = self._query_cache[query]
+            self._query_cache.move_to_end(query)
+        
+        while len(self._query_cache) > self.QUERY_CACHE_SIZE:
+            self._query_cache.popitem(last=False)
+        return embeddings
+    
+    def _semantic_lookup(self, query_embeddings: np.ndarray, top_k: int) -> List[Optional[List[Tuple[str, float]]]]:
+        """
+        For each query, return results from the candidates of a near-identical
+        earlier query, or None. Candidates are rescored against the new query,
+        so scores and order are its own. All queries are compared with the
+        cache in one matrix product.
+        """
+        if self.semantic_cache_threshold is None or not self._semantic_results:
+            return [None] * len(query_embeddings)
+        
+        count = len(self._semantic_results)
+        similarities = query_embeddings @ self._semantic_embeddings[:count].T
+        best = np.argmax(similarities, axis=1)
+        best_similarities = similarities[np.arange(len(best)), best]
+        
+        all_results = []
+        for query_embedding, entry, similarity in zip(query_embeddings, best.tolist(),
+                                                      best_similarities.tolist()):
+            candidates = self._semantic_results[entry]
+            if similarity < self.semantic_cache_threshold or len(candidates) < top_k:
+                all_results.append(None)
+                continue
+            scores = self.embeddings_norm[candidates].astype(np.float32, copy=False) @ query_embedding
+            order = np.argsort(-scores, kind='stable')[:top_k]
+            all_results.append([(self.item_ids[candidates[j]], float(scores[j]))
+                                for j in order.tolist()])
+        return all_results
+    
+    def _semantic_store(self, query_embedding: np.ndarray, candidates: List[int]) -> None:
+        """Remember the items a query found, overwriting the oldest entry when full."""
+        if self.semantic_cache_threshold is None:
+            return
+        
+        slot = self._semantic_next
+        self._semantic_embeddings[slot] = query_embedding
+        candidates = np.asarray(candidates, dtype=np.int64)
+        if slot < len(self._semantic_results):
+            self._semantic_results[slot] = candidates
+        else:
+            self._semantic_results.append(candidates)
+        self._semantic_next = (slot + 1) % self.SEMANTIC_CACHE_SIZE
 
-print("Initializing item ID semantic search...")
-ITEM_SEARCHER = ItemIDSearcher(list(VALID_ITEM_IDS))
+_item_searcher: Optional[ItemIDSearcher] = None
+_item_searcher_lock = threading.Lock()
+
+def get_item_searcher() -> ItemIDSearcher:
+    """
+    Return the shared item searcher, building it on first use.
+    
+    Loading the model and item embeddings takes seconds, so this happens
+    once per process rather than at import or on every tool call.
+    """
+    global _item_searcher
+    if _item_searcher is None:
+        with _item_searcher_lock:
+            if _item_searcher is None:
+                print("Initializing item ID semantic search...")
+                _item_searcher = ItemIDSearcher(
+                    VALID_ITEM_IDS, model_name=EMBEDDING_MODEL_NAME, cache_dir=CACHE_DIR,
+                    semantic_cache_threshold=SEMANTIC_CACHE_THRESHOLD,
+                    pca_components=EMBEDDING_PCA_COMPONENTS,
+                    quantization=EMBEDDING_QUANTIZATION,
+                    onnx_file=EMBEDDING_ONNX_FILE)
+    return _item_searcher
 
 # ====== TEST SCRIPT ==========================================================
 
@@ -875,6 +1363,8 @@ async def main():
     """Run an interactive terminal dialogue with the recipe modifier agent."""
 
     
+    get_item_searcher()
+    
     print("=" * 70)
     print("MINECRAFT RECIPE MODIFIER AGENT - Interactive Test")
     print("=" * 70)
@@ -926,6 +1416,12 @@ async def main():
         except Exception as e:
             print(f"\nError: {e}")
             print("Continuing session...\n")
+        finally:
+            # The agent writes its recipes when a turn completes; this catches
+            # turns that ended early
+            flush_result = flush_recipe_script()
+            if flush_result["status"] == "error":
+                print(f"\nError: {flush_result['error_message']}")
     
     print("-" * 70)
     print("Session ended.")
@@ -1,20 +1,29 @@
 import subprocess
 import sys
 import os
-import platform
-import asyncio
 from typing import Optional, Tuple, AsyncGenerator, Any
 
 # ===== Environment ===========================================================
+ENV_ACTIVE_VAR = "MCPA_ENV_ACTIVE"
+
 def ensure_environment(env_name: str = "conda-env") -> None:
     """
     Checks if the script is running via the python interpreter in the
     sibling folder. If not, re-launches the script using that interpreter.
     """
+    # Set only for the relaunched script, so it can never exec again. Popped
+    # so the server and other subprocesses it starts don't inherit it.
+    if os.environ.pop(ENV_ACTIVE_VAR, None):
+        return
+
     script_dir = os.path.dirname(os.path.abspath(__file__))
     env_path = os.path.join(script_dir, env_name)
-    
-    if platform.system() == "Windows":
+
+    # Comparing environment roots also holds when sys.executable is a symlink
+    if os.path.realpath(sys.prefix) == os.path.realpath(env_path):
+        return
+
+    if sys.platform == "win32":
         target_python = os.path.join(env_path, "python.exe")
     else: # Linux or Mac
         target_python = os.path.join(env_path, "bin", "python")
@@ -23,20 +32,19 @@ def ensure_environment(env_name: str = "conda-env") -> None:
         print(f"Error: Could not find Conda environment at: {target_python}. Do you need to run the install script?")
         sys.exit(1)
 
-    else:
-        current_exe = os.path.normpath(sys.executable)
-        target_python = os.path.normpath(target_python)
-
-        if current_exe != target_python:
-            print(f"Switching to local environment: {env_name}...")
-            os.execv(target_python, [target_python, __file__] + sys.argv[1:])
+    print(f"Switching to local environment: {env_name}...")
+    env = dict(os.environ, **{ENV_ACTIVE_VAR: "1"})
+    os.execve(target_python, [target_python, __file__] + sys.argv[1:], env)
 
 ensure_environment("conda-env")
 
 # ===== Initialization ========================================================
 
+# Heavy imports stay below ensure_environment, so a launch from the wrong
+# interpreter re-execs before paying for them
 import gradio as gr
-from modules.customizer import root_agent
+import threading
+from modules.customizer import root_agent, get_item_searcher, flush_recipe_script
 from google.adk.runners import Runner
 from google.adk.sessions import InMemorySessionService
 from google.genai import types
@@ -48,6 +56,21 @@ USER_ID: str = "default"
 session_service = InMemorySessionService()
 runner = Runner(agent=root_agent, app_name="default", session_service=session_service)
 
+# Load the item search model in the background so the UI comes up right away
+# but the first search doesn't pay for the model load
+threading.Thread(target=lambda: get_item_searcher().warm_up(), daemon=True).start()
+
+
+async def get_or_create_session(session_id: str) -> Any:
+    """Return the stored session with this ID, creating it on first use."""
+    session = await session_service.get_session(
+        app_name="default", user_id=USER_ID, session_id=session_id
+    )
+    if session is None:
+        session = await session_service.create_session(
+            app_name="default", user_id=USER_ID, session_id=session_id
+        )
+    return session
 
 async def process_message(
     user_input: str, 
@@ -69,15 +92,7 @@ async def process_message(
 
     # --- Session Management ---
     if current_session_id is None:
-        try:
-            session = await session_service.create_session(
-                app_name="default", user_id=USER_ID, session_id="default"
-            )
-        except Exception:
-            # Fallback to get_session if create fails
-            session = await session_service.get_session(
-                app_name="default", user_id=USER_ID, session_id="default"
-            )
+        session = await get_or_create_session("default")
         current_session_id = session.id
         print(f"Active session: {current_session_id}")
 
@@ -100,9 +115,17 @@ async def process_message(
                     yield accumulated_response, current_session_id
                     
     except Exception as e:
-        error_msg = f"Error: {str(e)}"
-        print(error_msg)
-        yield error_msg, current_session_id
+        accumulated_response = f"Error: {str(e)}"
+        print(accumulated_response)
+        yield accumulated_response, current_session_id
+    finally:
+        # The agent writes its recipes when a turn completes; this catches
+        # turns that ended early
+        flush_result = flush_recipe_script()
+
+    # The pipeline's own flush may already have reported this failure
+    if flush_result["status"] == "error" and flush_result["error_message"] not in accumulated_response:
+        yield f"{accumulated_response}\n\nError: {flush_result['error_message']}", current_session_id
 
 # ===== Other logic ===========================================================
 